@@ -11,37 +11,107 @@ Converts TF2 HUDs to work on both Windows and Linux using explicit paths:
 Based on my understanding after reviewing m0rehud.
 """
 
+import functools
+import os
 import sys
 import re
+from collections import deque
 from pathlib import Path
 
 
 # files need (depth + 2) levels of ../ to reach tf/cfg/
 CFG_DEPTH_OFFSET = 2
 
-
-def extract_path_after_parents(path):
-    # slighty tism way of stripping all leading '../' ('../../../cfg/file.txt' -> 'cfg/file.txt')
-    while path.startswith('../'):
-        path = path[3:]
-    return path
+# compiled once at import so the per-file loops skip the re cache lookup
+# all bytes patterns, files are read and written as raw bytes to skip the utf-8 round trip
+# (the syntax matched here is ascii, paths are lowercased through _lower_path)
+_FONT_RE = re.compile(rb'("font"\s+")(.*?)(")')
+_BASE_RE = re.compile(rb'^#base\s+"([^"]+)"', re.MULTILINE)
+# the leading ../ run gets its own group so the explicit path rewrite needs no second regex
+_ECHO_RE = re.compile(
+    rb'(echo\s+["\']?#base["\']?\s+["\']?)((?:\.\.[/\\])*)(.*?\.(?:res|vmt))(["\']?.*)',
+    re.IGNORECASE
+)
+# every #base include in a .res file, cfg and .res paths are told apart in the callback
+_RES_BASE_RE = re.compile(rb'(#base\s+")([^"]+)(")', re.IGNORECASE)
+# quoted resource/ or scripts/ schema paths, the lookahead rejects most quotes early
+_SCHEMA_RE = re.compile(rb'"(?=[rs])((?:resource|scripts)[/\\][^"]+)', re.IGNORECASE)
+# run of leading '../' ('../../../cfg/file.txt' -> '../../../'), always matches
+_LEAD_PARENTS_RE = re.compile(rb'(?:\.\./)*')
+
+# backslash -> slash and A-Z -> a-z in a single translate pass
+_PATH_XLAT = bytes.maketrans(b'\\ABCDEFGHIJKLMNOPQRSTUVWXYZ', b'/abcdefghijklmnopqrstuvwxyz')
+
+
+def _lower_path(path):
+    # backslash -> slash and lowercase, non-ascii paths go through str.lower()
+    # so they keep matching the files normalize_filenames renamed
+    if path.isascii():
+        return path.translate(_PATH_XLAT)
+    # file contents are decoded as utf-8 whatever the locale, surrogateescape passes bytes
+    # that aren't valid utf-8 (cp1252 files) through untouched instead of raising
+    text = path.decode('utf-8', 'surrogateescape')
+    return text.replace('\\', '/').lower().encode('utf-8', 'surrogateescape')
+
+
+def _walk(root, depth=0):
+    # recursive scandir yielding (entry, depth)
+    # DirEntry caches the stat so we skip building a Path per entry
+    # depth is the number of folders between root and the entry
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path, depth + 1)
+            yield entry, depth
+
+
+def _walk_ext(root, ext):
+    # stream (path, depth) for files under root ending in ext, one at a time
+    for entry, depth in _walk(root):
+        if entry.name.endswith(ext) and entry.is_file():
+            yield entry.path, depth
+
+
+def _write_bytes(path, data):
+    # raw os.open/os.write, skips building a buffered file object for every rewritten file
+    # (O_BINARY keeps windows from translating newlines)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _sub_changed(pattern, repl, content):
+    # pattern.sub that also reports whether the content changed
+    # (sub hands back the input object when nothing matched, so most files skip the compare)
+    new = pattern.sub(repl, content)
+    return new, new is not content and new != content
 
 
 def normalize_filenames(hud_dir):
     # recursively rename all files and folders to lowercase
     print("\nNormalizing filenames to lowercase...")
 
-    # depth first to avoid conflicts
-    all_paths = sorted(hud_dir.rglob('*'), key=lambda p: len(p.parts), reverse=True)
+    # depth first to avoid conflicts, bucketed by depth so there's no sort
+    buckets = []
+    for entry, depth in _walk(hud_dir):
+        while len(buckets) <= depth:
+            buckets.append([])
+        buckets[depth].append((entry.path, entry.name))
+
     rename_count = 0
-    for item in all_paths:
-        original_name = item.name
-        lowercase_name = original_name.lower()
-        if original_name != lowercase_name:
-            target = item.parent / lowercase_name
-            if not target.exists():
-                item.rename(target)
-                rename_count += 1
+    for bucket in reversed(buckets):
+        for path, original_name in bucket:
+            lowercase_name = original_name.lower()
+            if original_name != lowercase_name:
+                # scandir paths always end in the entry name, so splice the new name on directly
+                target = path[:-len(original_name)] + lowercase_name
+                if not os.path.exists(target):
+                    os.rename(path, target)
+                    rename_count += 1
 
     if rename_count > 0:
         print(f"    Lowercased {rename_count} file(s)")
@@ -49,38 +119,48 @@ def normalize_filenames(hud_dir):
         print("    No files need to be lowercased")
 
 
-def normalize_clientscheme_font_paths(file):
-    # lowercase font file paths in a clientscheme file
-    content = file.read_text(encoding='utf-8', errors='ignore')
-    original = content
-    content = re.sub(
-        r'("font"\s+")(.*?)(")',
-        lambda m: f'{m.group(1)}{m.group(2).replace("\\", "/").lower()}{m.group(3)}',
+def normalize_clientscheme_font_paths(content):
+    # lowercase font file paths in clientscheme content, returns (content, changed)
+    # most includes are color/border files without fonts
+    # (the pattern is case sensitive so a plain check is exact)
+    if b'"font"' not in content:
+        return content, False
+
+    return _sub_changed(
+        _FONT_RE,
+        lambda m: m.group(1) + _lower_path(m.group(2)) + m.group(3),
         content
     )
-    if content != original:
-        file.write_text(content, encoding='utf-8')
-        return True
-    return False
-
 
-def process_clientscheme(file, visited, modified_count=0):
-    # recursively process a clientscheme file and all its #base includes
-    file = file.resolve()
 
-    if file in visited or not file.exists():
-        return modified_count
-
-    visited.add(file)
-    if normalize_clientscheme_font_paths(file):
-        modified_count += 1
+def process_clientscheme(start_file):
+    # process a clientscheme file and all its #base includes, returns the modified count
+    # iterative so deep include chains can't hit the recursion limit
+    # paths are normalized strings, which also keeps the visited set cheap to hash
+    visited = set()
+    queue = deque([start_file])
+    modified_count = 0
+    while queue:
+        file = queue.popleft()
+        if file in visited or not os.path.exists(file):
+            continue
+
+        visited.add(file)
+
+        # read once, the #base scan below works on the same in-memory content
+        path = Path(file)
+        content = path.read_bytes()
+        normalized, changed = normalize_clientscheme_font_paths(content)
+        if changed:
+            _write_bytes(file, normalized)
+            modified_count += 1
 
-    content = file.read_text(encoding='utf-8', errors='ignore')
-    base_pattern = re.compile(r'^#base\s+"([^"]+)"', re.MULTILINE)
-    for match in base_pattern.finditer(content):
-        base_path = match.group(1)
-        included_file = (file.parent / base_path).resolve()
-        modified_count = process_clientscheme(included_file, visited, modified_count)
+        # #base paths are plain relative paths, so lexical normalization is enough
+        # (no realpath syscalls)
+        file_dir = os.path.dirname(file)
+        for match in _BASE_RE.finditer(normalized):
+            include = match.group(1).decode('utf-8', 'surrogateescape')
+            queue.append(os.path.normpath(os.path.join(file_dir, include)))
 
     return modified_count
 
@@ -94,117 +174,117 @@ def normalize_clientschemes(hud_dir):
         print("    No clientscheme.res found")
         return
 
-    visited = set()
-    modified_count = process_clientscheme(start_file, visited)
+    modified_count = process_clientscheme(str(start_file.resolve()))
     if modified_count > 0:
         print(f"    Modified {modified_count} clientscheme file(s)")
     else:
         print("    No clientscheme files need modification")
 
 
-def normalize_cfg_echo_paths(content, hud_name):
+def normalize_cfg_echo_paths(content, resource_repl, resource_custom,
+                             scripts_repl, scripts_custom):
     # normalize echo #base commands in .cfg files to use explicit paths
+    # returns (content, changed)
+    # the repls are the hud specific ../../custom/hud_name/(resource|scripts)/ prefixes,
+    # the customs are the /custom/hud_name/(resource|scripts)/ needles
+    # that mark already explicit paths
+
     def normalize_echo_path(match):
         prefix = match.group(1)# echo #base
-        path = match.group(2) # the file path
-        suffix = match.group(3) # rest of line
-        path = path.replace('\\', '/')
-
-        # normalize resource paths to explicit format
-        if '/resource/' in path and f'/custom/{hud_name}/resource/' not in path:
-            path = re.sub(r'(\.\./)+resource/', f'../../custom/{hud_name}/resource/', path)
-
-        # normalize scripts paths to explicit format
-        if '/scripts/' in path and f'/custom/{hud_name}/scripts/' not in path:
-            path = re.sub(r'(\.\./)+scripts/', f'../../custom/{hud_name}/scripts/', path)
-
-        path = path.lower()
-        return f'{prefix}{path}{suffix}'
-
-    return re.sub(
-        r'(echo\s+["\']?#base["\']?\s+["\']?)(.*?\.(?:res|vmt))(["\']?.*)',
-        normalize_echo_path,
-        content,
-        flags=re.IGNORECASE
-    )
+        ups = match.group(2).replace(b'\\', b'/') # leading ../ run
+        path = match.group(3).replace(b'\\', b'/') # the file path after it
+        suffix = match.group(4) # rest of line
 
+        if ups:
+            # normalize resource paths to explicit format
+            if path.startswith(b'resource/') and resource_custom not in path:
+                ups, path = resource_repl, path[len(b'resource/'):]
 
-def normalize_cfg_paths_in_res(content, file_depth):
-    # normalize #base paths to cfg files in .res files
-    def normalize_cfg_path(match):
-        prefix = match.group(1) # #base "
-        path = match.group(2) # the file path
-        suffix = match.group(3)# closing "
-        path = path.replace('\\', '/')
-        if '/cfg/' in path:
-            current_ups = path.count('../')
-            needed_ups = file_depth + CFG_DEPTH_OFFSET # need uppies :3 >w<
-
-            # only normalize if depth is wrong
-            if current_ups != needed_ups:
-                path_after_ups = extract_path_after_parents(path)
-                path = '../' * needed_ups + path_after_ups
-
-        path = path.lower()
-        return f'{prefix}{path}{suffix}'
-
-    return re.sub(
-        r'(#base\s+")(.*?cfg[^"]+)(")',
-        normalize_cfg_path,
-        content,
-        flags=re.IGNORECASE
-    )
+            # normalize scripts paths to explicit format
+            elif path.startswith(b'scripts/') and scripts_custom not in path:
+                ups, path = scripts_repl, path[len(b'scripts/'):]
 
+        path = _lower_path(ups + path)
+        return prefix + path + suffix
 
-def normalize_res_base_paths(content):
-    # normalize #base directives pointing to .res files (but not cfg paths)
-    def normalize_res_path(match):
-        prefix = match.group(1) # #base "
-        path = match.group(2) # the file path
-        suffix = match.group(3)# closing "
-        path = path.replace('\\', '/').lower()
-        return f'{prefix}{path}{suffix}'
-
-    return re.sub(
-        r'(#base\s+")((?:(?!cfg)[^"])+\.res)(")',
-        normalize_res_path,
-        content,
-        flags=re.IGNORECASE
-    )
+    return _sub_changed(_ECHO_RE, normalize_echo_path, content)
+
+
+@functools.lru_cache(maxsize=None)
+def _ups(count):
+    # '../' prefixes only come in a handful of depths, build each one once
+    return b'../' * count
 
 
-def normalize_schema_declarations(content):
-    # normalize schema declarations
-    def normalize_schema(match):
-        quote = match.group(1)
+def normalize_cfg_paths_in_res(path, file_depth):
+    # normalize a #base path to a cfg file in a .res file
+    path = path.replace(b'\\', b'/')
+    if b'/cfg/' in path:
+        ups_end = _LEAD_PARENTS_RE.match(path).end()
+        current_ups = ups_end // 3
+        needed_ups = file_depth + CFG_DEPTH_OFFSET # need uppies :3 >w<
+
+        # only normalize if depth is wrong
+        if current_ups != needed_ups:
+            path = _ups(needed_ups) + path[ups_end:]
+
+    return _lower_path(path)
+
+
+def normalize_res_paths(content, file_depth):
+    # normalize #base includes and schema declarations in a .res file, returns (content, changed)
+    def normalize_base_match(match):
+        # cfg paths get the depth fix and .res paths are lowercased,
+        # schema-style ones are left to the schema pass
         path = match.group(2)
-        path = path.replace('\\', '/').lower()
-        return f'{quote}{path}'
-
-    return re.sub(
-        r'(")((?:resource|scripts)[/\\][^"]+)',
-        normalize_schema,
-        content,
-        flags=re.IGNORECASE
+        lowered = path.lower()
+        # cfg followed by at least one char, same as the old .*?cfg[^"]+
+        if b'cfg' in lowered[:-1]:
+            path = normalize_cfg_paths_in_res(path, file_depth)
+        elif lowered.endswith(b'.res'):
+            path = _lower_path(path)
+        return match.group(1) + path + match.group(3)
+
+    def normalize_schema_match(match):
+        return b'"' + _lower_path(match.group(1))
+
+    content, changed = _sub_changed(_RES_BASE_RE, normalize_base_match, content)
+    content, schema_changed = _sub_changed(_SCHEMA_RE, normalize_schema_match, content)
+    return content, changed or schema_changed
+
+
+def _process_one_cfg(path, resource_repl, resource_custom, scripts_repl, scripts_custom):
+    # normalize a single .cfg file, returns True if it was modified
+    file = Path(path)
+    content = file.read_bytes()
+
+    # the echo regex needs both tokens, skip the scan when either is missing
+    lowered = content.lower()
+    if b'echo' not in lowered or b'#base' not in lowered:
+        return False
+
+    normalized, changed = normalize_cfg_echo_paths(
+        content, resource_repl, resource_custom, scripts_repl, scripts_custom
     )
+    if not changed:
+        return False
+    _write_bytes(path, normalized)
+    return True
 
 
-def process_cfg_files(hud_dir, hud_name):
+def process_cfg_files(hud_dir, resource_repl, resource_custom, scripts_repl, scripts_custom):
     # process .cfg files to normalize echo #base paths
     cfg_folder = hud_dir / "cfg"
     if not cfg_folder.exists():
         print("    No cfg folder found")
         return
 
-    cfg_files = list(cfg_folder.rglob("*.cfg"))
-    modified_count = 0
-    for file in cfg_files:
-        content = file.read_text(encoding='utf-8', errors='ignore')
-        original = content
-        content = normalize_cfg_echo_paths(content, hud_name)
-        if content != original:
-            modified_count += 1
-            file.write_text(content, encoding='utf-8')
+    cfg_files = (path for path, _ in _walk_ext(cfg_folder, '.cfg'))
+
+    modified_count = sum(
+        _process_one_cfg(path, resource_repl, resource_custom, scripts_repl, scripts_custom)
+        for path in cfg_files
+    )
 
     if modified_count > 0:
         print(f"    Modified {modified_count} .cfg file(s)")
@@ -212,29 +292,33 @@ def process_cfg_files(hud_dir, hud_name):
         print("    No .cfg files need modification")
 
 
+def _process_one_res(path, file_depth):
+    # normalize a single .res file, returns True if it was modified
+    file = Path(path)
+    content = file.read_bytes()
+
+    # layout-only files have nothing to rewrite,
+    # substring checks are far cheaper than the regex scan
+    # (lowered since the patterns are case insensitive)
+    lowered = content.lower()
+    if b'#base' not in lowered and b'resource' not in lowered and b'scripts' not in lowered:
+        return False
+
+    # apply all normalizations
+    normalized, changed = normalize_res_paths(content, file_depth)
+    if not changed:
+        return False
+    _write_bytes(path, normalized)
+    return True
+
+
 def process_res_files(hud_dir):
     # rocess .res files to normalize #base paths and references
-    res_files = list(hud_dir.rglob("*.res"))
-    modified_count = 0
-    for file in res_files:
-        content = file.read_text(encoding='utf-8', errors='ignore')
-        original = content
-
-        # calculate file dept
-        try:
-            relative_path = file.relative_to(hud_dir)
-            file_depth = len(relative_path.parts) - 1  # subtract the file itself
-        except ValueError:
-            file_depth = 0
-
-        # apply all normalizations
-        content = normalize_cfg_paths_in_res(content, file_depth)
-        content = normalize_res_base_paths(content)
-        content = normalize_schema_declarations(content)
-
-        if content != original:
-            modified_count += 1
-            file.write_text(content, encoding='utf-8')
+    res_files = _walk_ext(hud_dir, '.res')
+
+    # plain loop on purpose, pool startup and per-file task overhead
+    # cost more than this job takes
+    modified_count = sum(_process_one_res(path, file_depth) for path, file_depth in res_files)
 
     if modified_count > 0:
         print(f"    Modified {modified_count} .res file(s)")
@@ -246,8 +330,13 @@ def normalize_logbase_paths(hud_dir):
     # normalize all logbase paths to use explicit paths
     print("\nNormalizing logbase paths...")
 
-    hud_name = hud_dir.name
-    process_cfg_files(hud_dir, hud_name)
+    # hud specific replacements are built once here instead of per matched line
+    hud_name = os.fsencode(hud_dir.name)
+    resource_custom = b'/custom/' + hud_name + b'/resource/'
+    scripts_custom = b'/custom/' + hud_name + b'/scripts/'
+    resource_repl = b'../..' + resource_custom
+    scripts_repl = b'../..' + scripts_custom
+    process_cfg_files(hud_dir, resource_repl, resource_custom, scripts_repl, scripts_custom)
     process_res_files(hud_dir)
 
 